@@ -0,0 +1,286 @@
+"""
+benchmark of transports of try_getting_response() against local HTTP/2 test server.
+
+needs packages from requirements-benchmark.txt and openssl command. To start it type:
+
+    python benchmark_transport.py
+
+requests are made in the same way as parser makes them: a lot of small post requests, max_concurrency of VkSource
+at a time. Server is placed behind proxy, which counts opened connections and bytes transferred in both directions.
+Every row of result changes one thing compared to the previous row, so effects are shown separately:
+    1 -> 2 keeping connections alive
+    2 -> 3 library (requests -> httpx)
+    3 -> 4 HTTP/2 multiplexing instead of several HTTP/1.1 connections
+    4 -> 5 brotli instead of gzip (only if brotli is installed)
+"""
+import asyncio
+import gzip
+import importlib.util
+import json
+import os
+import socket
+import ssl
+import subprocess
+import queue
+import tempfile
+import threading
+import time
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+import httpx
+import requests
+from hypercorn.asyncio import serve
+from hypercorn.config import Config
+
+# parser.py is loaded from file, because in python 3.8 'import parser' gives module from standard library
+spec = importlib.util.spec_from_file_location('pm_parser', os.path.join(os.path.dirname(__file__), 'parser.py'))
+parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(parser)
+
+# number of requests made for every configuration
+NUM_OF_REQUESTS = 200
+# number of requests made at the same time, as in parser
+CONCURRENCY = parser.VkSource.max_concurrency
+
+
+def make_certificate(directory):
+    """
+    creates self-signed certificate for localhost
+
+    args:
+        directory - where to store files
+
+    return:
+        (certificate file, key file)
+    """
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=localhost', '-addext', 'subjectAltName=DNS:localhost',
+                    '-keyout', key_file, '-out', cert_file],
+                   check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return cert_file, key_file
+
+
+def get_free_port():
+    """
+    returns number of port which is free on localhost
+    """
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def app(scope, receive, send):
+    """
+    ASGI application answering every post request with json looking like response of vk API,
+    compressed as asked in Accept-Encoding
+    """
+    if scope['type'] != 'http':
+        return
+    # reading whole body of request
+    more_body = True
+    while more_body:
+        message = await receive()
+        more_body = message.get('more_body', False)
+
+    body = json.dumps({'response': {
+        'count': 1,
+        'items': [{'id': 1, 'text': 'Положительное', 'rate': 60.0}] * 20,
+    }}, ensure_ascii=False).encode()
+
+    headers = [(b'content-type', b'application/json')]
+    encodings = dict(scope['headers']).get(b'accept-encoding', b'').decode()
+    if brotli and 'br' in encodings:
+        body = brotli.compress(body)
+        headers.append((b'content-encoding', b'br'))
+    elif 'gzip' in encodings:
+        body = gzip.compress(body)
+        headers.append((b'content-encoding', b'gzip'))
+
+    await send({'type': 'http.response.start', 'status': 200, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+class CountingProxy:
+    """
+    TCP proxy, counting connections and bytes passed through it
+    """
+
+    def __init__(self, target_port):
+        self.target_port = target_port
+        self.connections = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def reset(self):
+        self.connections = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    async def handle(self, client_reader, client_writer):
+        self.connections += 1
+        server_reader, server_writer = await asyncio.open_connection('127.0.0.1', self.target_port)
+        await asyncio.gather(
+            self.pipe(client_reader, server_writer, 'bytes_sent'),
+            self.pipe(server_reader, client_writer, 'bytes_received'),
+        )
+
+    async def pipe(self, reader, writer, counter):
+        try:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                setattr(self, counter, getattr(self, counter) + len(data))
+                writer.write(data)
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+def start_servers(cert_file, key_file, proxy):
+    """
+    starts test server and proxy in another thread
+
+    args:
+        cert_file, key_file - certificate for server
+        proxy - CountingProxy, which forwards connections to server
+
+    return:
+        port of proxy
+    """
+    config = Config()
+    config.bind = [f'127.0.0.1:{proxy.target_port}']
+    config.certfile = cert_file
+    config.keyfile = key_file
+    config.loglevel = 'WARNING'
+    proxy_port = get_free_port()
+    started = threading.Event()
+
+    async def run():
+        await asyncio.start_server(proxy.handle, '127.0.0.1', proxy_port)
+        # with shutdown_trigger hypercorn doesn't set signal handlers, which is impossible outside of main thread
+        server = asyncio.ensure_future(serve(app, config, shutdown_trigger=asyncio.Event().wait))
+        # giving server time to start listening
+        await asyncio.sleep(1)
+        started.set()
+        await server
+
+    threading.Thread(target=asyncio.run, args=(run(),), daemon=True).start()
+    started.wait()
+    return proxy_port
+
+
+def run_requests(url, transport):
+    """
+    makes NUM_OF_REQUESTS post requests to url, CONCURRENCY at a time
+
+    return:
+        number of successful requests
+    """
+    nums = queue.Queue()
+    for num in range(NUM_OF_REQUESTS):
+        nums.put(num)
+    results = []
+
+    def worker():
+        while True:
+            try:
+                num = nums.get_nowait()
+            except queue.Empty:
+                return
+            err, response = parser.try_getting_response(url, method='board.getComments',
+                                                        post_args={'topic_id': num, 'count': 0},
+                                                        hedge=False, transport=transport)
+            if not err and response.json()['response']['count'] == 1:
+                results.append(num)
+
+    threads = [threading.Thread(target=worker) for _ in range(CONCURRENCY)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return len(results)
+
+
+def make_session(cert_file, encodings, keep_alive=True):
+    """
+    creates session for 'http1' transport of parser
+
+    args:
+        cert_file - certificate of test server
+        encodings - value of Accept-Encoding header
+        keep_alive - if False, server is asked to close connection after every response
+    """
+    session = requests.Session()
+    # otherwise REQUESTS_CA_BUNDLE from environment is used instead of session.verify
+    session.trust_env = False
+    session.verify = cert_file
+    session.headers['Accept-Encoding'] = encodings
+    if not keep_alive:
+        session.headers['Connection'] = 'close'
+    return session
+
+
+def make_httpx_client(cert_file, encodings, http2):
+    """
+    creates client for 'http2' transport of parser
+
+    args:
+        cert_file - certificate of test server
+        encodings - value of Accept-Encoding header
+        http2 - if False, client uses only HTTP/1.1
+    """
+    return httpx.Client(http2=http2, verify=ssl.create_default_context(cafile=cert_file),
+                        headers={'Accept-Encoding': encodings})
+
+
+def main():
+    """
+    runs benchmark for every configuration and prints table with results
+    """
+    gzip_only = 'gzip, deflate'
+    with tempfile.TemporaryDirectory() as directory:
+        cert_file, key_file = make_certificate(directory)
+
+        # (description, transport, setting up client of transport)
+        configurations = [
+            ('HTTP/1.1 requests, new connections, gzip', 'http1',
+             lambda: setattr(parser, 'http1_session', make_session(cert_file, gzip_only, keep_alive=False))),
+            ('HTTP/1.1 requests, kept-alive, gzip', 'http1',
+             lambda: setattr(parser, 'http1_session', make_session(cert_file, gzip_only))),
+            ('HTTP/1.1 httpx, kept-alive, gzip', 'http2',
+             lambda: parser.http2_clients.update(localhost=make_httpx_client(cert_file, gzip_only, http2=False))),
+            ('HTTP/2 httpx, gzip', 'http2',
+             lambda: parser.http2_clients.update(localhost=make_httpx_client(cert_file, gzip_only, http2=True))),
+        ]
+        if brotli:
+            configurations.append(
+                ('HTTP/2 httpx, brotli', 'http2',
+                 lambda: parser.http2_clients.update(localhost=make_httpx_client(cert_file, 'br', http2=True))))
+
+        proxy = CountingProxy(get_free_port())
+        proxy_port = start_servers(cert_file, key_file, proxy)
+        url = f'https://localhost:{proxy_port}/method'
+
+        rows = [('configuration', 'successful', 'connections', 'bytes sent', 'bytes received', 'seconds')]
+        for description, transport, set_up in configurations:
+            set_up()
+            parser.start_run_deadline()
+            proxy.reset()
+            start_time = time.monotonic()
+            successful = run_requests(url, transport)
+            duration = time.monotonic() - start_time
+            rows.append((description, f'{successful}/{NUM_OF_REQUESTS}', proxy.connections,
+                         proxy.bytes_sent, proxy.bytes_received, f'{duration:.2f}'))
+        parser.print_formatted(rows)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,79 @@
+import abc
+import argparse
+import collections
+import queue
 import re
 import requests
+import requests.adapters
 import threading
-
-
-def main():
+import time
+from urllib.parse import urlsplit
+
+# optional transport with HTTP/2 and brotli, used if packages from requirements-http2.txt are installed
+try:
+    import httpx
+except ImportError:
+    httpx = None
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# compressions asked from servers. Brotli is asked only if it can be decoded
+ACCEPT_ENCODING = 'br, gzip, deflate' if brotli else 'gzip, deflate'
+
+# seconds to wait for connection to be established and for server to send response
+CONNECT_TIMEOUT = 5
+READ_TIMEOUT = 15
+
+# seconds given to one run (e.g. getting all teachers' data). After that outstanding requests are abandoned
+# and only data that was already fetched is printed
+RUN_TIME_LIMIT = 60
+
+# requests to these hosts are duplicated, if they are slower than 95% of previous requests to the same host
+HEDGED_HOSTS = {'professorrating.org'}
+# delay before duplicating request, used while there's not enough requests to host to count 95th percentile
+HEDGE_DEFAULT_DELAY = 3
+# number of latest response times per host used to count 95th percentile
+HEDGE_SAMPLES = 100
+
+# transport used by default in try_getting_response(): 'http1' (requests) or 'http2' (httpx)
+DEFAULT_TRANSPORT = 'http1'
+# max number of kept-alive connections per host for 'http1' transport
+HTTP1_POOL_SIZE = 32
+
+# time (as in time.monotonic()) when current run must be finished, None if there's no limit
+run_deadline = None
+
+# dict of format <host>:<list of latest response times>, filled by post_request()
+response_times = {}
+response_times_lock = threading.Lock()
+
+# registered rating sources (instances of RatingSource subclasses), in order of columns in output
+RATING_SOURCES = []
+
+# requests.Session for 'http1' transport, keeping connections alive between requests. Created by get_http1_session()
+http1_session = None
+http1_session_lock = threading.Lock()
+
+# dict of format <host>:<httpx.Client>. One client keeps one connection to host, which is shared by all requests
+http2_clients = {}
+http2_clients_lock = threading.Lock()
+
+
+def main(args=None):
     """
     main function
+
+    args:
+        args - list of command line arguments, sys.argv[1:] by default
     """
+    arguments = parse_arguments(args)
+    # query mode: print data about matching teachers and exit
+    if arguments.teacher is not None or arguments.department is not None:
+        print_teachers_data(teacher=arguments.teacher, department=arguments.department)
+        return
+
     greeting = """Hello! To get information about teachers type 1. To get information about departments print 2. Type 0 to exit.
 Rating about teachers was fetched from:
     1) vk.com/pmprepod and represented in format "positive-negative-neutral | total"
@@ -19,50 +86,143 @@ so, 1 or 2?"""
     while inp != '0':
         inp = input()
         if inp == '1':
-            print_all_teachers_data()
+            print_teachers_data()
         elif inp == '2':
             print_all_departments_data()
 
 
-def print_all_teachers_data():
+def parse_arguments(args=None):
     """
-    prints all data about teachers
+    parses command line arguments
+
+    args:
+        args - list of arguments, sys.argv[1:] by default
+
+    return:
+        argparse.Namespace with attributes teacher and department (None if not given)
+    """
+    argument_parser = argparse.ArgumentParser(
+        description='Information about teachers and departments of apmath.spbu.ru. '
+                    'Without arguments starts interactive menu')
+    argument_parser.add_argument('--teacher', metavar='NAME',
+                                 help='print data only about teachers whose name contains NAME')
+    argument_parser.add_argument('--department', metavar='NAME',
+                                 help='print data only about teachers whose department contains NAME')
+    return argument_parser.parse_args(args)
+
+
+def print_teachers_data(teacher=None, department=None):
+    """
+    prints data about teachers, by default about all of them
+
+    args:
+        teacher, department - passed to query_teachers()
 
     return:
         error
 
     errors:
         0 OK
+        1 no teachers match teacher and department
         -1 something went wrong
     messages, if errors occur, are written from this function, so no need to handle them later
     """
-    err, data = get_parsed_data('teachers')
-    if err:
+    start_run_deadline()
+    err, teachers_data_dict = query_teachers(teacher=teacher, department=department)
+    if err == 1:
+        print('No teachers found!')
+        return 1
+    if err == -1:
         last_level_error(msg='information about teachers')
         return -1
-
-    # get teachers' rating
-    teachers_data_dict = data
-    teachers_names = sorted(teachers_data_dict)
-    err, ratings = get_ratings_by_teachers_names(teachers_names)
     if err:
         last_level_error(msg="teachers' rating")
         return -1
 
     # first line in 2d list that will be printed, representing titles of columns
-    labels = [('name', 'degree', 'department', 'rank', 'VK rating', 'professorrating.org')]
+    labels = [('name', 'degree', 'department', 'rank', *[source.label for source in RATING_SOURCES])]
 
     # adding info about teacher to output list
+    teachers_names = sorted(teachers_data_dict)
     output_rows = labels + [
         (name,
          teachers_data_dict[name]['degree'],
          teachers_data_dict[name]['department'],
          teachers_data_dict[name]['rank'],
-         *ratings[name],
+         *teachers_data_dict[name]['ratings'],
          ) for name in teachers_names
     ]
     # print everything
     print_formatted(output_rows)
+    return 0
+
+
+def query_teachers(teacher=None, department=None):
+    """
+    gets data and rating of teachers. If teacher or department is given, names are filtered by data from staff page
+    first, and rating is fetched only for matching teachers, which takes much fewer requests than for all of them
+
+    args:
+        teacher - part of teacher's name, case doesn't matter
+        department - part of department's name, case doesn't matter
+
+    return:
+        err,
+        teachers_data - dict of format: {
+                <name>:{
+                    'degree':..,
+                    'department':..,
+                    'rank':..,
+                    'ratings': tuple of formatted ratings, in order of RATING_SOURCES
+                }
+            }
+
+    errors:
+        0 OK
+        1 no teachers match teacher and department
+        -1 could not get information about teachers
+        -2 could not get teachers' rating
+    """
+    err, teachers_data_dict = get_parsed_data('teachers')
+    if err:
+        return (-1, 0)
+
+    teachers_data_dict = filter_teachers(teachers_data_dict, teacher=teacher, department=department)
+    if not teachers_data_dict:
+        return (1, 0)
+
+    # get teachers' rating
+    err, ratings = get_ratings_by_teachers_names(teachers_data_dict)
+    if err:
+        return (-2, 0)
+
+    return (0, {
+        name: {**data, 'ratings': ratings[name]} for name, data in teachers_data_dict.items()
+    })
+
+
+def filter_teachers(teachers_data_dict, teacher=None, department=None):
+    """
+    finds teachers matching both teacher and department
+
+    args:
+        teachers_data_dict - dict returned by parse_teachers()
+        teacher - part of teacher's name, case doesn't matter. If None, every name matches
+        department - part of department's name, case doesn't matter. If None, every department matches
+
+    return:
+        part of teachers_data_dict with matching teachers
+    """
+    def normalize(text):
+        # names are stored with 'е' instead of 'ё', see parse_teachers()
+        return text.lower().replace('ё', 'е')
+
+    return {
+        name: data for name, data in teachers_data_dict.items()
+        if (teacher is None or normalize(teacher) in normalize(name))
+        # row of staff page can have less fields than needed, then parse_teachers() stores it without department
+        and (department is None or normalize(department) in normalize(data.get('department', '')))
+    }
 
 
 def print_all_departments_data():
@@ -77,6 +237,7 @@ def print_all_departments_data():
         -1 something went wrong
     error messages are print inside this function
     """
+    start_run_deadline()
     err, departments_data = get_parsed_data('departments')
     if err:
         last_level_error('list of departments')
@@ -91,7 +252,7 @@ def print_all_departments_data():
 
 def last_level_error(msg):
     """
-    prints error which occurred in print_all_teachers_data() or print_all_departments_data()
+    prints error which occurred in print_teachers_data() or print_all_departments_data()
 
     args:
         msg - message added to print
@@ -99,6 +260,38 @@ def last_level_error(msg):
     print(f'Was unable to get {msg}! Try to check connection and then repeat command')
 
 
+def start_run_deadline(time_limit=RUN_TIME_LIMIT):
+    """
+    sets deadline for current run. Requests that weren't finished before it are abandoned
+
+    args:
+        time_limit - seconds given to run, None to remove limit
+    """
+    global run_deadline
+    run_deadline = None if time_limit is None else time.monotonic() + time_limit
+
+
+def time_left():
+    """
+    return:
+        seconds left before run deadline (never negative), None if there's no deadline
+    """
+    return time_left_until(run_deadline)
+
+
+def time_left_until(deadline):
+    """
+    args:
+        deadline - time (as in time.monotonic()) or None
+
+    return:
+        seconds left before deadline (never negative), None if deadline is None
+    """
+    if deadline is None:
+        return None
+    return max(deadline - time.monotonic(), 0)
+
+
 def print_formatted(output_rows, separate_labels=True, delta=1):
     """
     given 2-dimensional list, outputs data, so that each element in column is placed directly under
@@ -139,19 +332,21 @@ def transpose(matrix):
     return list(zip(*matrix))
 
 
-def get_ratings_by_teachers_names(teachers):
+def get_ratings_by_teachers_names(teachers, sources=None):
     """
     get compound rating from teachers' names. if rating for someone is not found, it will be represented by '---'
 
     args:
         teachers - list of teachers' names (or another object that acts like it when iterated, such as dict or set)
+        sources - list of rating sources, RATING_SOURCES by default
 
     return:
         err,
         rating_compound - dict of format: {
                 <name>:(
-                    <formatted rating from vk>,
-                    <formatted rating from professorrating.org>
+                    <formatted rating from 1st source>,
+                    <formatted rating from 2nd source>,
+                    ...
                 )
             }
 
@@ -159,24 +354,25 @@ def get_ratings_by_teachers_names(teachers):
         0 OK
         -1 something went wrong, operation is aborted, no intermediate values is returned
     """
-    # creating threads to get different ratings
-    ratings = {}
-    threads = [
-        threading.Thread(target=get_rating_wrapper, args=(mode, teachers, ratings))
-        for mode in ('vk', 'prof_rat')
-    ]
-    [thread.start() for thread in threads]
-    [thread.join() for thread in threads]
-
-    # if ratings doesn't have 2 elements, then somewhere error occurred and operation has to be aborted
-    if len(ratings) != 2:
+    if sources is None:
+        sources = RATING_SOURCES
+
+    # units of all sources are executed together
+    scheduler = UnitScheduler(teachers)
+    for source in sources:
+        scheduler.add_source(source)
+    ratings = scheduler.run()
+
+    # if no rating was got because of errors, then operation has to be aborted.
+    # rating which wasn't got (e.g. because of deadline) is represented by '---' for every teacher
+    if not any(ratings.values()) and scheduler.num_of_failed:
         return (-1, 0)
 
     # if everything is ok, create returned dict
     rating_compound = {
-        name: (
-            rating_format(ratings['vk'][name], mode='vk') if name in ratings['vk'] else '---',
-            rating_format(ratings['prof_rat'][name], mode='prof_rat') if name in ratings['prof_rat'] else '---',
+        name: tuple(
+            source.format_rating(ratings[source.name][name]) if name in ratings[source.name] else '---'
+            for source in sources
         ) for name in teachers
     }
     return (0, rating_compound)
@@ -307,7 +503,7 @@ def get_rating_by_topic_id(topic_id):
     }
     # getting data about topic
     error, board_data = try_getting_response('https://api.vk.com/method/', method='board.getComments',
-                                             post_args=post_args)
+                                             post_args=post_args, transport='http2')
     if error:
         return (-1, 0)
 
@@ -334,30 +530,6 @@ def get_rating_by_topic_id(topic_id):
     return (0, {'total': total_votes, **answers_distribution})
 
 
-def get_rating_by_topic_id_wrapper(topic_id, container, key):
-    """
-    wrapper to make threads possible for get_rating_by_topic_id()
-    args:
-        topic_id - will be passed to function,
-        container - dict, to which returned values of function will be written,
-        key - name for response in dict
-
-    addition made to container: {
-        <key>:<distribution>   #error is not written
-    }
-
-    <distribution> has such format: {
-                                'total' - total votes, int
-                                'up' - percent of positives, float
-                                'down' - % of negatives, float
-                                'neutral' - % of neutral, float
-                            }
-    """
-    err, distribution = get_rating_by_topic_id(topic_id)
-    if not err:
-        container[key] = distribution
-
-
 def get_topics_list():
     """
     get data about all topics in group
@@ -373,82 +545,32 @@ def get_topics_list():
     post_args = {
         **default_args,
         **{
-            'count': 0,
+            'count': 100,
             'offset': 0,
         }
     }
 
-    err, board_data = try_getting_response('https://api.vk.com/method', method='board.getTopics', post_args=post_args)
-    if err:
-        return (-1, 0)
-
-    board_data = board_data.json()
-    # board_data is dict made from json
-
-    number_of_topics = board_data['response']['count']
-
     # dict of <title>:<id>
     topics_ids = {}
 
-    # vk API allows only getting no more that 100 topics per 1 time. To get another 100, need to use offset
-    # loop has ~ 2 iterations so threading is not really needed
-    post_args['count'] = 100
-    for offset in range(0, number_of_topics, 100):
-        post_args['offset'] = offset
+    # vk API allows only getting no more that 100 topics per 1 time. To get another 100, need to use offset.
+    # total number of topics is known from first response, so loop has ~ 2 iterations and threading is not really needed
+    number_of_topics = 1
+    while post_args['offset'] < number_of_topics:
         err, board_data = try_getting_response('https://api.vk.com/method', method='board.getTopics',
-                                               post_args=post_args)
+                                               post_args=post_args, transport='http2')
         if err:
             return (-1, 0)
         board_data = board_data.json()
+        # board_data is dict made from json
+        number_of_topics = board_data['response']['count']
         # ..['items'] contains data about all of topics
         for topic in board_data['response']['items']:
             topics_ids[topic['title']] = topic['id']
+        post_args['offset'] += 100
     return (0, topics_ids)
 
 
-def get_ratings_from_vk(teachers):
-    """
-    given teachers names returns rating from vk
-
-    args:
-        teachers - list of teachers' names (or another object that acts like it when iterated, such as dict or set)
-    return:
-        err,
-        ratings - dict of format: {
-                <teacher's name>:<distribution>,
-                ...
-            }
-
-    <distribution> has such format: {
-                                'total' - total votes
-                                'up' - percent of positives
-                                'down' - % of negatives
-                                'neutral' - % of neutral
-                            }
-
-    errors:
-        0 OK
-        -1 not ok
-    """
-    ratings = {}
-    err, topics_ids = get_topics_list()
-    if not err:
-        threads = []
-        for name in teachers:
-            if name in topics_ids:
-                threads.append(
-                    threading.Thread(target=get_rating_by_topic_id_wrapper, args=(topics_ids[name], ratings, name)))
-        [thread.start() for thread in threads]
-        [thread.join() for thread in threads]
-        # if ratings is not empty:
-        if ratings:
-            return (0, ratings)
-
-    # when some type of error happened
-
-    return (-1, 0)
-
-
 def professorrating_parse_by_page(page):
     """
     given page number returns parsed data about professors and their rating
@@ -471,7 +593,7 @@ def professorrating_parse_by_page(page):
 
     url = 'https://professorrating.org/blocks'
     post_args = {'page': page, 'id': 2445, 'typePR': 4}
-    err, response = try_getting_response(url, method='page_helper.php', post_args=post_args)
+    err, response = try_getting_response(url, method='page_helper.php', post_args=post_args, transport='http2')
     if err:
         return (-1, 0)
 
@@ -488,27 +610,6 @@ def professorrating_parse_by_page(page):
     return (0, zip(names, ratings))
 
 
-def proffessorrating_parser_wrapper(page, rating_container):
-    """
-    wrapper to make threads possible for professorrating_parse_by_page()
-    args:
-        page - will be passed to function,
-        rating_container - dict, to which returned values of function will be written,
-
-
-    additions made to rating_container: {
-        <name of teacher>:<corresponding rating>
-        ...                              #error is not written
-    }
-    """
-    err, names_ratings = professorrating_parse_by_page(page)
-    if not err:
-        for name, rating in names_ratings:
-            # if rating is 0.0 then it is not stored
-            if float(rating):
-                rating_container[name] = rating
-
-
 def get_total_num_of_professorrating_pages():
     """
     finds and returns total number of pages on site having data about rating
@@ -524,7 +625,8 @@ def get_total_num_of_professorrating_pages():
     default_num = 214
 
     # getting page on which info about pages is stored
-    err, response = try_getting_response('https://professorrating.org/kafedra.php?id=2445#gsc.tab=0')
+    err, response = try_getting_response('https://professorrating.org/kafedra.php?id=2445#gsc.tab=0',
+                                         transport='http2')
     if not err:
         html_text = response.text
         # line about number of pages has this format: (e.g. "1 по 10 из 214", where 214 is number we need)
@@ -535,99 +637,324 @@ def get_total_num_of_professorrating_pages():
     return (1, default_num)
 
 
-def get_rating_from_professorrating(teachers):
-    """
-    given teachers names returns rating from professorrating.org
+"""
+rating sources and scheduler executing them
+"""
 
-    args:
-        teachers - list of teachers' names (or another object that acts like it when iterated, such as dict or set)
-    return:
-        err,
-        rating - dict of format: {
-                            <name>:<rating>
-                        }
 
-    errors:
-        0 OK
-        -1 not ok
+class RatingSource(abc.ABC):
     """
+    base class for source of teachers' rating. To add new source, subclass it, implement abstract methods and register
+    its instance with register_rating_source(). Units of all sources are executed together by UnitScheduler
+
+    attributes:
+        name - key of source, must be unique
+        label - title of column with rating from this source
+        max_concurrency - max number of units of this source executed at the same time
+        min_interval - min number of seconds between starts of two units of this source
+    """
+    name = ''
+    label = ''
+    max_concurrency = 8
+    min_interval = 0
+
+    @abc.abstractmethod
+    def get_units(self, teachers):
+        """
+        returns units, from which getting rating is started
+
+        args:
+            teachers - set of teachers' names
+
+        return:
+            list of units, each of format (function, args, tag):
+                function - called as function(*args), returns (err, result) like other functions here
+                tag - any object, passed to parse() with result
+        """
+
+    @abc.abstractmethod
+    def parse(self, tag, result, teachers, ratings):
+        """
+        handles result of unit which finished without error. Calls of parse() are never made at the same time
+
+        args:
+            tag - tag of unit
+            result - result returned by function of unit
+            teachers - set of teachers' names
+            ratings - dict of format <name>:<rating>, to which ratings from this source are written
+
+        return:
+            list of units to execute next (can be empty)
+        """
+
+    def on_error(self, tag, err, teachers, ratings):
+        """
+        handles unit which finished with error or raised exception (then err is -1). By default nothing is done,
+        but source which adds next units from parse() can add them here too, so one failed unit doesn't stop
+        getting rating.
+        Calls of on_error() and parse() are never made at the same time
+
+        args:
+            tag - tag of unit
+            err - error returned by function of unit
+            teachers, ratings - same as in parse()
+
+        return:
+            list of units to execute next (can be empty)
+        """
+        return []
+
+    @abc.abstractmethod
+    def format_rating(self, rating):
+        """
+        returns rating, written to ratings in parse(), formatted as string
+        """
+
+
+class VkSource(RatingSource):
+    """
+    rating from polls in topics of vk.com/pmprepod. Topics are found by teachers' names
 
-    # get total number of pages
-    _, num_of_pages = get_total_num_of_professorrating_pages()
-
-    # create thread for each page
-    ratings = {}
-    threads = []
-    for page_num in range(0, num_of_pages, 10):
-        threads.append(threading.Thread(target=proffessorrating_parser_wrapper, args=(page_num, ratings)))
-    [thread.start() for thread in threads]
-    [thread.join() for thread in threads]
-
-    # create ratings dict for those teachers who:
-    #    1) have non-zero rating
-    #    2) are in teachers list
-    teachers = set(teachers)
-    ratings_for_existing_teachers = {
-        name: val for name, val in ratings.items() if name in teachers
-    }
+    <rating> has such format: {
+                            'total' - total votes
+                            'up' - percent of positives
+                            'down' - % of negatives
+                            'neutral' - % of neutral
+                        }
+    """
+    name = 'vk'
+    label = 'VK rating'
+    max_concurrency = 16
+
+    def get_units(self, teachers):
+        # tag None is for list of topics, tags of polls are teachers' names
+        return [(get_topics_list, (), None)]
+
+    def parse(self, tag, result, teachers, ratings):
+        if tag is None:
+            topics_ids = result
+            return [(get_rating_by_topic_id, (topics_ids[name],), name) for name in teachers if name in topics_ids]
+        ratings[tag] = result
+        return []
+
+    def format_rating(self, rating):
+        return '{:.1f}-{:.1f}-{:.1f} | {} '.format(rating['up'],
+                                                   rating['down'],
+                                                   rating['neutral'],
+                                                   rating['total'], )
 
-    # if dict is non-empty
-    if ratings_for_existing_teachers:
-        return (0, ratings_for_existing_teachers)
 
-    # when some type of error happened
-    return (-1, 0)
+class ProfessorratingSource(RatingSource):
+    """
+    rating from professorrating.org. <rating> is string, storing one float (e. g. "4.3")
+    """
+    name = 'prof_rat'
+    label = 'professorrating.org'
+    max_concurrency = 8
+
+    def get_units(self, teachers):
+        # tag None is for number of pages, tags of pages are dict shared by all pages of run: {
+        #     'next_page' - number of page (as in post request) to fetch next,
+        #     'num_of_pages' - total number of pages
+        # }
+        return [(self.get_num_of_pages, (), None)]
+
+    def get_num_of_pages(self):
+        """
+        get_total_num_of_professorrating_pages(), which doesn't return error, because default number of pages is ok
+        """
+        _, num_of_pages = get_total_num_of_professorrating_pages()
+        return (0, num_of_pages)
+
+    def parse(self, tag, result, teachers, ratings):
+        # site can't be searched by teacher, so pages are fetched max_concurrency at a time, and every finished page
+        # adds next one only while some teachers are not found yet. When all teachers are found early, the rest
+        # of pages isn't fetched, but teacher without rating still takes all pages
+        if tag is None:
+            pages = {'next_page': 0, 'num_of_pages': result}
+            return [self.get_next_page_unit(pages) for _ in range(self.max_concurrency)
+                    if pages['next_page'] < pages['num_of_pages']]
+
+        for name, rating in result:
+            # if rating is 0.0 then it is not stored
+            if float(rating) and name in teachers:
+                ratings[name] = rating
+        return self.get_units_after_page(tag, teachers, ratings)
+
+    def on_error(self, tag, err, teachers, ratings):
+        # failed page is skipped, but next page is still fetched
+        return self.get_units_after_page(tag, teachers, ratings)
+
+    def get_units_after_page(self, pages, teachers, ratings):
+        """
+        returns unit fetching next page if some teachers are not found yet, empty list otherwise
+
+        args:
+            pages - dict, which is tag of pages
+            teachers, ratings - same as in parse()
+        """
+        if len(ratings) < len(teachers) and pages['next_page'] < pages['num_of_pages']:
+            return [self.get_next_page_unit(pages)]
+        return []
+
+    def get_next_page_unit(self, pages):
+        """
+        returns unit fetching next page and moves pages['next_page'] to the page after it
+
+        args:
+            pages - dict, which is tag of pages
+        """
+        unit = (professorrating_parse_by_page, (pages['next_page'],), pages)
+        pages['next_page'] += 10
+        return unit
+
+    def format_rating(self, rating):
+        return '{}'.format(rating)
 
 
-def get_rating_wrapper(mode, teachers, container):
+def register_rating_source(source):
     """
-    wrapper for functions getting rating. It allows multithreading
+    adds rating source to RATING_SOURCES, so that its rating is shown with information about teachers
 
     args:
-        mode - string defining what function would be called:
-            'vk' or 'prof_rat'. If not, exception wil be raised
-        teachers - object representing teachers' names. Will be passed to functions
-        container - container to store returned value
+        source - instance of RatingSource subclass
 
-    addition to container:{
-        <mode>:<data returned by corresponding functions>
-    }
-    if error occurred, then data won't be written to container, which will later cause abortion of getting rating
+    raises:
+        ValueError if source with the same name is already registered
     """
-    if mode == 'vk':
-        func = get_ratings_from_vk
-    elif mode == 'prof_rat':
-        func = get_rating_from_professorrating
-    else:
-        raise WrongModeException('Wrong mode for rating wrapper!')
+    if any(source.name == registered.name for registered in RATING_SOURCES):
+        raise ValueError(f'rating source {source.name} is already registered!')
+    RATING_SOURCES.append(source)
 
-    err, ratings = func(teachers)
-    if not err:
-        container[mode] = ratings
 
+register_rating_source(VkSource())
+register_rating_source(ProfessorratingSource())
 
-def rating_format(rating, mode):
-    """
-    format rating given the certain format
 
-    args:
-        rating - object, containing data to format:
-            for vk it is {'up':.., 'down':.., 'neutral':.., 'total':..},
-            for prof_rat it is float conversed to string
-        mode - 'vk' or 'prof_rat'(if not, exception raised), by which data will be formatted
-
-    return:
-        formatted string
+class UnitScheduler:
+    """
+    executes units of several rating sources at the same time, each unit in its own thread.
+    Number of running units and frequency of their starts are limited for every source by its attributes.
+    Units added by parse() are started as soon as source has free place, so sources don't wait for each other
     """
-    if mode == 'vk':
-        return '{:.1f}-{:.1f}-{:.1f} | {} '.format(rating['up'],
-                                                   rating['down'],
-                                                   rating['neutral'],
-                                                   rating['total'], )
-    elif mode == 'prof_rat':
-        return '{}'.format(rating)
-    else:
-        raise WrongModeException(' in rating_format()!')
+
+    def __init__(self, teachers):
+        """
+        args:
+            teachers - teachers' names, passed to sources
+        """
+        self.teachers = set(teachers)
+        self.sources = []
+        # dicts of format <source name>:<value>
+        self.ratings = {}
+        self.pending_units = {}
+        self.num_of_running = {}
+        self.next_start_time = {}
+        # number of units which were added but not finished yet
+        self.num_of_unfinished = 0
+        # number of units which returned negative error (e.g. request wasn't successful) or raised exception
+        self.num_of_failed = 0
+        # guards everything above, also makes parse() calls not to happen at the same time
+        self.condition = threading.Condition()
+        # run deadline is taken when scheduler is created, because next run sets new one, and units of this run,
+        # which are still running then, must not continue with deadline of the next run
+        self.deadline = run_deadline
+        # set when run() returns. After that units of this run aren't started, parsed and don't add next units
+        self.cancelled = threading.Event()
+
+    def add_source(self, source):
+        """
+        adds source and its first units
+
+        args:
+            source - instance of RatingSource subclass
+        """
+        with self.condition:
+            self.sources.append(source)
+            self.ratings[source.name] = {}
+            self.pending_units[source.name] = collections.deque()
+            self.num_of_running[source.name] = 0
+            self.next_start_time[source.name] = 0
+            self.add_units(source, source.get_units(self.teachers))
+
+    def add_units(self, source, units):
+        """
+        adds units of source and starts those allowed by limits. Must be called with self.condition acquired
+        """
+        self.pending_units[source.name].extend(units)
+        self.num_of_unfinished += len(units)
+        self.start_units()
+
+    def start_units(self):
+        """
+        starts pending units of every source while its limit allows it. Must be called with self.condition acquired
+        """
+        for source in self.sources:
+            pending_units = self.pending_units[source.name]
+            while pending_units and self.num_of_running[source.name] < source.max_concurrency:
+                self.num_of_running[source.name] += 1
+                start_time = max(time.monotonic(), self.next_start_time[source.name])
+                self.next_start_time[source.name] = start_time + source.min_interval
+                threading.Thread(target=self.execute, args=(source, pending_units.popleft(), start_time),
+                                 daemon=True).start()
+
+    def execute(self, source, unit, start_time):
+        """
+        executes unit of source and passes its result to source.parse(). Runs in its own thread
+
+        args:
+            start_time - time (as in time.monotonic()) before which unit can't be started
+        """
+        function, args, tag = unit
+        new_units = []
+        try:
+            delay = start_time - time.monotonic()
+            if delay > 0:
+                time_left = time_left_until(self.deadline)
+                time.sleep(delay if time_left is None else min(delay, time_left))
+            # no need to start unit after deadline
+            if self.is_active():
+                try:
+                    err, result = function(*args)
+                except Exception:
+                    # e.g. vk API answered with error instead of 'response', or response is not json.
+                    # Such unit is failed in the same way as unit returning negative error
+                    err, result = -1, None
+                with self.condition:
+                    # result isn't used if run returned while unit was executed
+                    if self.is_active():
+                        if not err:
+                            new_units = source.parse(tag, result, self.teachers, self.ratings[source.name])
+                        else:
+                            if err < 0:
+                                self.num_of_failed += 1
+                            new_units = source.on_error(tag, err, self.teachers, self.ratings[source.name])
+        finally:
+            with self.condition:
+                self.num_of_running[source.name] -= 1
+                self.num_of_unfinished -= 1
+                self.add_units(source, new_units)
+                self.condition.notify_all()
+
+    def run(self):
+        """
+        waits for all units (including added by parse()) to finish, but not longer than run deadline
+
+        return:
+            dict of format <source name>:<ratings dict of source>
+        """
+        with self.condition:
+            self.condition.wait_for(lambda: self.num_of_unfinished == 0, time_left_until(self.deadline))
+            # units that didn't finish before deadline are abandoned, their results won't be used
+            self.cancelled.set()
+            return {name: dict(ratings) for name, ratings in self.ratings.items()}
+
+    def is_active(self):
+        """
+        return:
+            True if run is not cancelled and its deadline hasn't passed
+        """
+        return not self.cancelled.is_set() and time_left_until(self.deadline) != 0
 
 
 def parse_teachers(html_text):
@@ -687,19 +1014,24 @@ def parse_departments(html_text):
     return departments_list
 
 
-def try_getting_response(url, post_args=None, method=''):
+def try_getting_response(url, post_args=None, method='', hedge=None, transport=None):
     """
     function tries to get post request
     args:
         url
         method - pass method to post request(like 'something.php')
         post_args - arguments for post request
+        hedge - if True, request is duplicated when it is slower than 95% of previous requests to the same host,
+            and the first response is used. By default, it is True for hosts from HEDGED_HOSTS
+        transport - 'http1' to use requests with kept-alive connections, or 'http2' to use one shared connection
+            per host with HTTP/2 (if host supports it). Both ask for gzip/brotli compression.
+            'http2' falls back to 'http1' if httpx isn't installed. By default, DEFAULT_TRANSPORT is used
     return:
         error,
-        requests.Response object
+        requests.Response or httpx.Response object (both have .status_code, .text and .json())
     errors:
         0 OK
-        -1 if wrong url or can't reach
+        -1 if wrong url or can't reach, request timed out or run deadline passed
     """
     # format url to use method
     if post_args is None:
@@ -709,16 +1041,218 @@ def try_getting_response(url, post_args=None, method=''):
         url += '/'
     url += method
 
+    # no time to make request
+    if time_left() == 0:
+        return (-1, None)
+
+    host = urlsplit(url).hostname
+    if hedge is None:
+        hedge = host in HEDGED_HOSTS
+    if transport is None:
+        transport = DEFAULT_TRANSPORT
+    if transport not in ('http1', 'http2'):
+        raise WrongModeException('Wrong transport in try_getting_response()!')
+
+    if hedge:
+        return hedged_post_request(url, post_args, host, transport)
+    return post_request_until_deadline(url, post_args, host, transport)
+
+
+def post_request(url, post_args, host, transport='http1'):
+    """
+    makes one post request with timeouts, which are cut to not exceed run deadline.
+    used in try_getting_response()
+
+    args:
+        url - full url of request
+        post_args - arguments for post request
+        host - host of url, response time is stored for it
+        transport - 'http1' or 'http2', see try_getting_response()
+
+    return:
+        error,
+        requests.Response or httpx.Response object
+    errors:
+        0 OK
+        -1 if can't reach, got bad response or request timed out
+    """
+    connect_timeout = CONNECT_TIMEOUT
+    read_timeout = READ_TIMEOUT
+    if time_left() is not None:
+        # run deadline passed while waiting for another request
+        if time_left() == 0:
+            return (-1, None)
+        connect_timeout = min(connect_timeout, time_left())
+        read_timeout = min(read_timeout, time_left())
+
+    client = get_http2_client(host) if transport == 'http2' else None
+
+    start_time = time.monotonic()
     try:
-        response = requests.post(url, post_args)
+        if client is None:
+            response = get_http1_session().post(url, post_args, timeout=(connect_timeout, read_timeout))
+        else:
+            response = client.post(url, data=post_args, timeout=httpx.Timeout(read_timeout, connect=connect_timeout))
         # if response is good
         if response.status_code == 200:
+            add_response_time(host, time.monotonic() - start_time)
             return (0, response)
     except:
         pass
     return (-1, None)
 
 
+def post_request_until_deadline(url, post_args, host, transport='http1'):
+    """
+    makes post request and waits for it not longer than run deadline. Read timeout of request is for one read
+    from socket, not for whole response, so without it slow server could send response longer than run deadline.
+    used in try_getting_response()
+
+    args: same as in post_request()
+    return: same as in post_request()
+    """
+    if time_left() is None:
+        return post_request(url, post_args, host, transport)
+
+    results = queue.Queue()
+    threading.Thread(target=lambda: results.put(post_request(url, post_args, host, transport)), daemon=True).start()
+    try:
+        return results.get(timeout=time_left())
+    except queue.Empty:
+        return (-1, None)
+
+
+def hedged_post_request(url, post_args, host, transport='http1'):
+    """
+    makes post request and, if it was not answered in time in which 95% of previous requests to host were answered,
+    makes the same request once more. Returns the first good response.
+    Second request is always made with 'http1' transport, so it doesn't go through the same connection as the first one
+    (with 'http2' both would share one connection, with 'http1' the first one keeps its connection busy)
+    used in try_getting_response()
+
+    args: same as in post_request()
+    return: same as in post_request()
+    """
+    results = queue.Queue()
+
+    def attempt(attempt_transport):
+        results.put(post_request(url, post_args, host, attempt_transport))
+
+    threading.Thread(target=attempt, args=(transport,), daemon=True).start()
+    hedge_delay = get_hedge_delay(host)
+    if time_left() is not None:
+        hedge_delay = min(hedge_delay, time_left())
+    try:
+        return results.get(timeout=hedge_delay)
+    except queue.Empty:
+        pass
+
+    # run deadline passed while waiting for the first request
+    if time_left() == 0:
+        return (-1, None)
+
+    # first request is too slow, so it is duplicated through another connection
+    threading.Thread(target=attempt, args=('http1',), daemon=True).start()
+    # read timeout of request is for one read from socket, not for whole response, so slow server can send response
+    # longer than timeout. That's why requests are waited for not longer than run deadline
+    for _ in range(2):
+        try:
+            err, response = results.get(timeout=time_left())
+        except queue.Empty:
+            return (-1, None)
+        if not err:
+            return (0, response)
+    return (-1, None)
+
+
+def get_http1_session():
+    """
+    returns requests.Session for 'http1' transport shared by all requests, creating it if needed.
+    Session keeps connections alive, so requests to the same host don't open new connection every time
+
+    return:
+        requests.Session
+    """
+    global http1_session
+    with http1_session_lock:
+        if http1_session is None:
+            http1_session = requests.Session()
+            http1_session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+            # by default only 10 connections per host are kept, the rest are closed after request
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=HTTP1_POOL_SIZE)
+            http1_session.mount('http://', adapter)
+            http1_session.mount('https://', adapter)
+        return http1_session
+
+
+def make_http2_client(verify=True):
+    """
+    creates client for 'http2' transport. It uses HTTP/2 if server supports it (HTTP/1.1 otherwise),
+    and asks server to compress responses with brotli (if brotli is installed) or gzip
+
+    args:
+        verify - passed to httpx.Client, True to check certificates with default CA bundle
+
+    return:
+        httpx.Client, or None if httpx or h2 aren't installed
+    """
+    try:
+        return httpx.Client(http2=True, verify=verify, headers={'Accept-Encoding': ACCEPT_ENCODING})
+    except (AttributeError, ImportError):
+        # httpx is None (AttributeError) or h2 isn't installed (ImportError)
+        return None
+
+
+def get_http2_client(host):
+    """
+    returns client for 'http2' transport shared by all requests to host, creating it if needed
+
+    args:
+        host
+
+    return:
+        httpx.Client, or None if 'http2' transport is not available
+    """
+    with http2_clients_lock:
+        if host not in http2_clients:
+            http2_clients[host] = make_http2_client()
+        return http2_clients[host]
+
+
+def add_response_time(host, response_time):
+    """
+    stores response time of request to host, used to count delay for hedged requests
+
+    args:
+        host
+        response_time - seconds, float
+    """
+    with response_times_lock:
+        host_times = response_times.setdefault(host, [])
+        host_times.append(response_time)
+        # only latest times are kept
+        del host_times[:-HEDGE_SAMPLES]
+
+
+def get_hedge_delay(host):
+    """
+    finds delay after which request to host is duplicated
+
+    args:
+        host
+
+    return:
+        95th percentile of latest response times of host, or HEDGE_DEFAULT_DELAY if there are not enough of them
+    """
+    with response_times_lock:
+        host_times = sorted(response_times.get(host, []))
+
+    # 95th percentile can't be counted from less than 20 values
+    if len(host_times) < 20:
+        return HEDGE_DEFAULT_DELAY
+    return host_times[int(len(host_times) * 0.95)]
+
+
 class WrongModeException(Exception):
     """
     used in functions that get mode as one of args.
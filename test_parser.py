@@ -0,0 +1,463 @@
+"""
+tests of parser.py. To start them type:
+
+    python -m pytest
+"""
+import importlib.util
+import os
+import threading
+import time
+
+import pytest
+
+# parser.py is loaded from file, because in python 3.8 'import parser' gives module from standard library
+spec = importlib.util.spec_from_file_location('pm_parser', os.path.join(os.path.dirname(__file__), 'parser.py'))
+parser = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(parser)
+
+
+@pytest.fixture(autouse=True)
+def run_deadline():
+    """
+    every test has its own run deadline, so tests with stuck units don't hang
+    """
+    parser.start_run_deadline(5)
+    yield
+    parser.start_run_deadline(None)
+
+
+class StubSource(parser.RatingSource):
+    """
+    source with one root unit, which gives follow-up unit for every teacher.
+    unit of teacher returns rating given by unit_result(name)
+    """
+
+    def __init__(self, name='stub', max_concurrency=8, min_interval=0, unit_result=None, duration=0):
+        self.name = name
+        self.label = name
+        self.max_concurrency = max_concurrency
+        self.min_interval = min_interval
+        self.unit_result = unit_result or (lambda name: (0, name.upper()))
+        self.duration = duration
+        # for checking limits: start times of units and max number of units running at the same time
+        self.start_times = []
+        self.num_of_running = 0
+        self.max_num_of_running = 0
+        self.lock = threading.Lock()
+        self.parsed_tags = []
+
+    def fetch(self, name):
+        with self.lock:
+            self.start_times.append(time.monotonic())
+            self.num_of_running += 1
+            self.max_num_of_running = max(self.max_num_of_running, self.num_of_running)
+        time.sleep(self.duration)
+        with self.lock:
+            self.num_of_running -= 1
+        return self.unit_result(name)
+
+    def get_units(self, teachers):
+        return [(lambda: (0, sorted(teachers)), (), None)]
+
+    def parse(self, tag, result, teachers, ratings):
+        self.parsed_tags.append(tag)
+        if tag is None:
+            return [(self.fetch, (name,), name) for name in result]
+        ratings[tag] = result
+        return []
+
+    def format_rating(self, rating):
+        return rating
+
+
+def run_scheduler(teachers, *sources):
+    """
+    runs UnitScheduler with sources
+
+    return:
+        (scheduler, ratings returned by run(), seconds spent)
+    """
+    scheduler = parser.UnitScheduler(teachers)
+    start_time = time.monotonic()
+    for source in sources:
+        scheduler.add_source(source)
+    ratings = scheduler.run()
+    return scheduler, ratings, time.monotonic() - start_time
+
+
+def test_rating_source_without_methods_cannot_be_created():
+    class IncompleteSource(parser.RatingSource):
+        def get_units(self, teachers):
+            return []
+
+    with pytest.raises(TypeError):
+        IncompleteSource()
+
+
+def test_follow_up_units_from_parse_are_executed():
+    source = StubSource()
+    _, ratings, _ = run_scheduler(['a', 'b', 'c'], source)
+
+    assert ratings == {'stub': {'a': 'A', 'b': 'B', 'c': 'C'}}
+    assert source.parsed_tags[0] is None
+    assert sorted(source.parsed_tags[1:]) == ['a', 'b', 'c']
+
+
+def test_concurrency_is_limited_for_every_source():
+    teachers = [str(num) for num in range(6)]
+    limited = StubSource(name='limited', max_concurrency=2, duration=0.05)
+    other = StubSource(name='other', max_concurrency=3, duration=0.05)
+    _, ratings, _ = run_scheduler(teachers, limited, other)
+
+    assert limited.max_num_of_running == 2
+    assert other.max_num_of_running == 3
+    assert len(ratings['limited']) == len(ratings['other']) == 6
+
+
+def test_sources_are_executed_at_the_same_time():
+    teachers = [str(num) for num in range(4)]
+    sources = [StubSource(name=str(num), max_concurrency=4, duration=0.2) for num in range(3)]
+    _, _, seconds = run_scheduler(teachers, *sources)
+
+    # serial phases would take 3 * 0.2
+    assert seconds < 0.45
+
+
+def test_min_interval_between_starts():
+    source = StubSource(min_interval=0.05)
+    run_scheduler(['a', 'b', 'c', 'd'], source)
+
+    start_times = sorted(source.start_times)
+    intervals = [second - first for first, second in zip(start_times, start_times[1:])]
+    assert len(intervals) == 3
+    assert min(intervals) >= 0.04
+
+
+def test_run_returns_at_deadline():
+    parser.start_run_deadline(0.2)
+    source = StubSource(duration=2)
+    _, ratings, seconds = run_scheduler(['a', 'b'], source)
+
+    assert seconds < 1
+    assert ratings == {'stub': {}}
+
+
+def test_failed_units_are_counted_and_not_parsed():
+    results = {'a': (0, 'A'), 'b': (-1, None), 'c': (1, None)}
+    source = StubSource(unit_result=results.get)
+    scheduler, ratings, _ = run_scheduler(['a', 'b', 'c'], source)
+
+    assert ratings == {'stub': {'a': 'A'}}
+    assert 'b' not in source.parsed_tags and 'c' not in source.parsed_tags
+    # positive error (e.g. topic without poll) is not failure
+    assert scheduler.num_of_failed == 1
+
+
+def test_get_ratings_by_teachers_names_fails_only_if_units_failed():
+    failing = StubSource(unit_result=lambda name: (-1, None))
+    assert parser.get_ratings_by_teachers_names(['a'], [failing]) == (-1, 0)
+
+    without_rating = StubSource(unit_result=lambda name: (1, None))
+    assert parser.get_ratings_by_teachers_names(['a'], [without_rating]) == (0, {'a': ('---',)})
+
+
+def test_on_error_adds_next_units():
+    class RetryingSource(StubSource):
+        def on_error(self, tag, err, teachers, ratings):
+            return [(lambda: (0, 'retried'), (), tag)]
+
+    source = RetryingSource(unit_result=lambda name: (-1, None))
+    scheduler, ratings, _ = run_scheduler(['a'], source)
+
+    assert ratings == {'stub': {'a': 'retried'}}
+    assert scheduler.num_of_failed == 1
+
+
+@pytest.fixture
+def professorrating_pages(monkeypatch):
+    """
+    replaces requests to professorrating.org: 22 pages (214 teachers), page with number N has teachers 'N'..'N+9'.
+    pages from failed_pages return error, pages from page_delays are returned after delay in seconds
+
+    return:
+        (list of fetched page numbers, set of failed pages, dict of page delays), all can be changed by test
+    """
+    fetched_pages = []
+    failed_pages = set()
+    page_delays = {}
+
+    def parse_by_page(page):
+        fetched_pages.append(page)
+        time.sleep(page_delays.get(page, 0))
+        if page in failed_pages:
+            return (-1, 0)
+        return (0, [(str(num), '4.5') for num in range(page, min(page + 10, 214))])
+
+    monkeypatch.setattr(parser, 'get_total_num_of_professorrating_pages', lambda: (0, 214))
+    monkeypatch.setattr(parser, 'professorrating_parse_by_page', parse_by_page)
+    return fetched_pages, failed_pages, page_delays
+
+
+def test_professorrating_stops_when_teachers_are_found(professorrating_pages):
+    fetched_pages, _, page_delays = professorrating_pages
+    # page with teacher is the first to finish
+    page_delays.update({page: 0.1 for page in range(10, 214, 10)})
+    _, ratings, _ = run_scheduler(['5'], parser.ProfessorratingSource())
+
+    assert ratings == {'prof_rat': {'5': '4.5'}}
+    # only first window of pages is started
+    assert len(fetched_pages) <= parser.ProfessorratingSource.max_concurrency
+
+
+def test_professorrating_fetches_all_pages_for_missing_teacher(professorrating_pages):
+    fetched_pages, _, _ = professorrating_pages
+    _, ratings, _ = run_scheduler(['nobody'], parser.ProfessorratingSource())
+
+    assert ratings == {'prof_rat': {}}
+    assert sorted(fetched_pages) == list(range(0, 214, 10))
+
+
+def test_professorrating_failed_page_does_not_stop_fetching(professorrating_pages):
+    fetched_pages, failed_pages, _ = professorrating_pages
+    failed_pages.add(10)
+    # teacher is on the last page, so every page must be fetched
+    _, ratings, _ = run_scheduler(['213'], parser.ProfessorratingSource())
+
+    assert ratings == {'prof_rat': {'213': '4.5'}}
+    assert sorted(fetched_pages) == list(range(0, 214, 10))
+
+
+def test_professorrating_failed_first_window_does_not_stop_fetching(professorrating_pages):
+    fetched_pages, failed_pages, _ = professorrating_pages
+    failed_pages.update(range(0, 80, 10))
+    teachers = [str(num) for num in range(214)]
+    _, ratings, _ = run_scheduler(teachers, parser.ProfessorratingSource())
+
+    assert sorted(fetched_pages) == list(range(0, 214, 10))
+    assert len(ratings['prof_rat']) == 214 - 80
+
+
+@pytest.fixture
+def fake_post_request(monkeypatch):
+    """
+    replaces post_request() with fake one. Attempt number N (from 0) sleeps attempts[N][0] seconds
+    and returns attempts[N][1]. Hedge delay is 0.1 seconds
+
+    return:
+        (list of attempts to be filled by test, list of transports of made attempts)
+    """
+    attempts = []
+    transports = []
+    lock = threading.Lock()
+
+    def post_request(url, post_args, host, transport='http1'):
+        with lock:
+            delay, result = attempts[len(transports)]
+            transports.append(transport)
+        time.sleep(delay)
+        return result
+
+    monkeypatch.setattr(parser, 'post_request', post_request)
+    monkeypatch.setattr(parser, 'get_hedge_delay', lambda host: 0.1)
+    return attempts, transports
+
+
+def test_hedge_is_not_sent_for_fast_response(fake_post_request):
+    attempts, transports = fake_post_request
+    attempts.extend([(0, (0, 'first')), (0, (0, 'second'))])
+
+    assert parser.hedged_post_request('https://host/', {}, 'host', 'http2') == (0, 'first')
+    time.sleep(0.15)
+    assert transports == ['http2']
+
+
+def test_hedge_is_sent_once_for_slow_response(fake_post_request):
+    attempts, transports = fake_post_request
+    attempts.extend([(0.5, (0, 'first')), (0, (0, 'second'))])
+
+    assert parser.hedged_post_request('https://host/', {}, 'host', 'http2') == (0, 'second')
+    # duplicate goes through its own connection
+    assert transports == ['http2', 'http1']
+
+
+def test_hedge_is_waited_for_if_first_request_fails(fake_post_request):
+    attempts, transports = fake_post_request
+    attempts.extend([(0.15, (-1, None)), (0.2, (0, 'second'))])
+
+    assert parser.hedged_post_request('https://host/', {}, 'host', 'http1') == (0, 'second')
+    assert len(transports) == 2
+
+
+def test_hedged_request_returns_at_deadline(fake_post_request):
+    attempts, _ = fake_post_request
+    attempts.extend([(1, (0, 'first')), (1, (0, 'second'))])
+    parser.start_run_deadline(0.3)
+
+    start_time = time.monotonic()
+    assert parser.hedged_post_request('https://host/', {}, 'host', 'http1') == (-1, None)
+    assert time.monotonic() - start_time < 0.6
+
+
+def test_hedge_delay_is_default_for_few_samples(monkeypatch):
+    monkeypatch.setattr(parser, 'response_times', {})
+    for _ in range(19):
+        parser.add_response_time('host', 0.01)
+
+    assert parser.get_hedge_delay('host') == parser.HEDGE_DEFAULT_DELAY
+    assert parser.get_hedge_delay('another_host') == parser.HEDGE_DEFAULT_DELAY
+
+
+def test_hedge_delay_is_95th_percentile(monkeypatch):
+    monkeypatch.setattr(parser, 'response_times', {})
+    # only latest HEDGE_SAMPLES (100) times are kept, so first ones are forgotten
+    for num in range(1, 151):
+        parser.add_response_time('host', num / 100)
+
+    # kept times are 0.51..1.5, index 95 of them is 1.46
+    assert parser.get_hedge_delay('host') == pytest.approx(1.46)
+
+
+def test_units_of_finished_run_are_not_continued_by_next_run():
+    parser.start_run_deadline(0.1)
+    source = StubSource(duration=0.3)
+    scheduler, ratings, _ = run_scheduler(['a'], source)
+    assert ratings == {'stub': {}}
+
+    # next run starts while unit of previous one is still running
+    parser.start_run_deadline(5)
+    time.sleep(0.4)
+    assert source.parsed_tags == [None]
+    assert scheduler.ratings == {'stub': {}}
+    assert scheduler.num_of_unfinished == 0
+
+
+def test_request_without_hedge_returns_at_deadline(fake_post_request):
+    attempts, _ = fake_post_request
+    attempts.append((1, (0, 'first')))
+    parser.start_run_deadline(0.2)
+
+    start_time = time.monotonic()
+    assert parser.try_getting_response('https://host', hedge=False) == (-1, None)
+    assert time.monotonic() - start_time < 0.5
+
+
+def test_request_without_hedge_returns_response(fake_post_request):
+    attempts, transports = fake_post_request
+    attempts.append((0, (0, 'first')))
+
+    assert parser.try_getting_response('https://host', hedge=False, transport='http2') == (0, 'first')
+    assert transports == ['http2']
+
+
+def test_unit_raising_exception_is_failed():
+    def raise_key_error(name):
+        raise KeyError('response')
+
+    class RecordingSource(StubSource):
+        def on_error(self, tag, err, teachers, ratings):
+            self.errors = getattr(self, 'errors', []) + [(tag, err)]
+            return []
+
+    source = RecordingSource(unit_result=raise_key_error)
+    scheduler, ratings, _ = run_scheduler(['x'], source)
+
+    assert ratings == {'stub': {}}
+    assert scheduler.num_of_failed == 1
+    assert source.errors == [('x', -1)]
+
+    source = StubSource(unit_result=raise_key_error)
+    assert parser.get_ratings_by_teachers_names(['x'], [source]) == (-1, 0)
+
+
+def test_source_with_registered_name_is_not_registered():
+    with pytest.raises(ValueError):
+        parser.register_rating_source(StubSource(name=parser.VkSource.name))
+    assert [source.name for source in parser.RATING_SOURCES] == ['vk', 'prof_rat']
+
+
+STAFF = {
+    'Иванов Иван Иванович': {'degree': 'д.ф.-м.н.', 'department': 'Кафедра теории управления', 'rank': 'профессор'},
+    'Петров Петр Петрович': {'degree': 'к.ф.-м.н.', 'department': 'Кафедра компьютерных технологий', 'rank': 'доцент'},
+    'Петрова Анна Сергеевна': {'degree': '', 'department': 'Кафедра теории управления', 'rank': 'ассистент'},
+    # row with less fields than needed
+    'Сидоров Сидор': {'degree': ''},
+}
+
+
+def test_filter_teachers_by_part_of_name_ignoring_case():
+    assert set(parser.filter_teachers(STAFF, teacher='петров')) == {'Петров Петр Петрович', 'Петрова Анна Сергеевна'}
+    assert set(parser.filter_teachers(STAFF, teacher='ИВАН')) == {'Иванов Иван Иванович'}
+
+
+def test_filter_teachers_replaces_yo():
+    # names are stored with 'е' instead of 'ё'
+    assert set(parser.filter_teachers(STAFF, teacher='Пётр Пётрович')) == {'Петров Петр Петрович'}
+    assert set(parser.filter_teachers(STAFF, teacher='ПЁТР ')) == {'Петров Петр Петрович'}
+
+
+def test_filter_teachers_by_name_and_department():
+    assert set(parser.filter_teachers(STAFF, teacher='петров', department='управления')) == {'Петрова Анна Сергеевна'}
+
+
+def test_filter_teachers_without_department_field():
+    assert set(parser.filter_teachers(STAFF, department='кафедра')) == set(STAFF) - {'Сидоров Сидор'}
+    assert set(parser.filter_teachers(STAFF)) == set(STAFF)
+
+
+def test_parse_arguments():
+    arguments = parser.parse_arguments(['--teacher', 'Петров', '--department', 'управления'])
+    assert (arguments.teacher, arguments.department) == ('Петров', 'управления')
+
+    arguments = parser.parse_arguments([])
+    assert (arguments.teacher, arguments.department) == (None, None)
+
+
+@pytest.fixture
+def fake_teachers_data(monkeypatch):
+    """
+    replaces staff page with STAFF and ratings with 'rating of <name>' from one source
+
+    return:
+        list of teachers' names, for which rating was asked
+    """
+    asked_names = []
+
+    def get_ratings_by_teachers_names(teachers):
+        asked_names.extend(teachers)
+        return (0, {name: (f'rating of {name}',) for name in teachers})
+
+    monkeypatch.setattr(parser, 'get_parsed_data', lambda mode: (0, dict(STAFF)))
+    monkeypatch.setattr(parser, 'get_ratings_by_teachers_names', get_ratings_by_teachers_names)
+    return asked_names
+
+
+def test_query_teachers_gets_rating_only_of_matching_teachers(fake_teachers_data):
+    err, teachers_data = parser.query_teachers(teacher='петров', department='управления')
+
+    assert err == 0
+    assert fake_teachers_data == ['Петрова Анна Сергеевна']
+    assert teachers_data == {'Петрова Анна Сергеевна': {
+        **STAFF['Петрова Анна Сергеевна'], 'ratings': ('rating of Петрова Анна Сергеевна',)}}
+
+
+def test_query_teachers_without_match(fake_teachers_data):
+    assert parser.query_teachers(teacher='никто') == (1, 0)
+    assert fake_teachers_data == []
+
+
+def test_main_with_both_options_prints_matching_teachers(fake_teachers_data, monkeypatch, capsys):
+    monkeypatch.setattr(parser, 'RATING_SOURCES', [StubSource(name='rating')])
+    parser.main(['--teacher', 'Иван', '--department', 'управления'])
+
+    output = capsys.readouterr().out
+    assert 'rating of Иванов Иван Иванович' in output
+    assert 'Петрова' not in output
+    assert fake_teachers_data == ['Иванов Иван Иванович']
+
+
+def test_main_without_match_prints_message(fake_teachers_data, capsys):
+    assert parser.print_teachers_data(teacher='никто') == 1
+    parser.main(['--teacher', 'никто'])
+
+    assert capsys.readouterr().out == 'No teachers found!\n' * 2
+    assert fake_teachers_data == []